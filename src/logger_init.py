@@ -1,18 +1,136 @@
 import logging
+import logging.handlers
+import multiprocessing
+import atexit
+import json
+import glob
 import os
-import datetime
+import time
 import sys
 
+LOGFILE = 'traj_file_scanner.log'
 
-def logger_init(time, folder, *args, force=False, mode='INFO'):
+
+class JSONFormatter(logging.Formatter):
+    """
+    format the log records as single line JSON objects.
+    """
+
+    def format(self, record):
+        logDict = {
+            'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            'name': record.name,
+            'level': record.levelname,
+            'process': record.process,
+            'func': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            logDict['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(logDict)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    aggregate the repeated messages. Only the first `rate` records of each
+    logging call site are passed within `period` seconds, the number of the
+    suppressed records is attached to the next passed record of the site.
+    The records at or above `minLevel` are always passed.
     """
-    create the logger with using a new log file.
+
+    def __init__(self, rate=10, period=60.0, minLevel=logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.min_level = minLevel
+        # (pathname, lineno) -> [window start, passed, suppressed]
+        self.sites = {}
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+
+        if (site is None) or (record.created - site[0] >= self.period):
+            if (site is not None) and (site[2] > 0):
+                record.msg = '{msg} [{n:,} similar messages suppressed]'.\
+                    format(msg=record.getMessage(), n=site[2])
+                record.args = None
+            self.sites[key] = [record.created, 1, 0]
+            return True
+
+        if site[1] < self.rate:
+            site[1] += 1
+            return True
+
+        site[2] += 1
+        return False
+
+    def flush(self, handler, logger):
+        """
+        emit the number of the suppressed records of each call site.
+        """
+
+        for (pathname, lineno), site in self.sites.items():
+            if site[2] > 0:
+                msg = '{n:,} similar messages suppressed at {file}:{line}'.\
+                    format(n=site[2], file=os.path.basename(pathname),
+                           line=lineno)
+                handler.emit(logger.makeRecord(
+                    logger.name, logging.INFO, pathname, lineno, msg,
+                    None, None))
+                site[2] = 0
+
+
+def clean_logs(folder, retentionDays):
+    """
+    remove the log files and profiles older than retentionDays.
+    """
+
+    for file in glob.glob(os.path.join(folder, '*')):
+        try:
+            if time.time() - os.path.getmtime(file) > retentionDays * 86400:
+                os.remove(file)
+        except OSError:
+            pass
+
+
+def logger_init(folder, *args, force=False, mode='INFO',
+                maxBytes=10 * 1024 * 1024, backupCount=10, retentionDays=90):
+    """
+    create the logger. The records are passed through a queue to the file
+    and stdout handlers, which are run in a separate thread, so that logging
+    doesn't block the scanner.
 
     Parameters
     ----------
+    folder: str
+    folder of the log files.
+
+    Keywords
+    --------
+    force: bool
+    whether to replace the handlers of the existing logger.
+
+    mode: str
+    logging level, 'DEBUG', 'INFO', 'WARNING' or 'ERROR'.
+
+    maxBytes: int
+    the log file is rotated when it exceeds maxBytes.
+
+    backupCount: int
+    number of rotated log files to be kept.
+
+    retentionDays: int
+    log files older than retentionDays will be removed.
 
     Returns
     -------
+    logger: logging.Logger
 
     History
     -------
@@ -22,11 +140,10 @@ def logger_init(time, folder, *args, force=False, mode='INFO'):
     if not os.path.exists(folder):
         os.mkdir(folder)
 
+    clean_logs(folder, retentionDays)
+
     # initialize the logger
-    logfile = '{time}_log'.format(
-        time=datetime.datetime.strftime(time, '%Y%m%d_%H%M%S')
-        )
-    logFullpath = os.path.join(folder, logfile)
+    logFullpath = os.path.join(folder, LOGFILE)
     logModeDict = {
         'INFO': logging.INFO,
         'WARNING': logging.WARNING,
@@ -36,19 +153,39 @@ def logger_init(time, folder, *args, force=False, mode='INFO'):
     logger = logging.getLogger(__name__)
     logger.setLevel(logModeDict[mode])
 
-    fh = logging.FileHandler(logFullpath)
+    if logger.handlers:
+        if not force:
+            return logger
+        for handler in logger.handlers[:]:
+            handler.close()
+            logger.removeHandler(handler)
+
+    fh = logging.handlers.RotatingFileHandler(
+        logFullpath, maxBytes=maxBytes, backupCount=backupCount)
     fh.setLevel(logModeDict[mode])
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logModeDict[mode])
 
-    formatterFh = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s' +
-                                    ' - %(funcName)s - %(lineno)d' +
-                                    ' - %(message)s')
-    formatterCh = logging.Formatter('%(message)s')
-    fh.setFormatter(formatterFh)
-    ch.setFormatter(formatterCh)
+    fh.setFormatter(JSONFormatter())
+    ch.setFormatter(logging.Formatter('%(message)s'))
+
+    # the records of the forked worker processes are sent through the same
+    # queue to the listener of the main process
+    logQueue = multiprocessing.Queue(-1)
+    qh = logging.handlers.QueueHandler(logQueue)
+    rateLimitFilter = RateLimitFilter()
+    qh.addFilter(rateLimitFilter)
+    listener = logging.handlers.QueueListener(
+        logQueue, fh, ch, respect_handler_level=True)
+    listener.start()
+
+    def stop_listener():
+        rateLimitFilter.flush(qh, logger)
+        listener.stop()
+        fh.close()
+
+    atexit.register(stop_listener)
 
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    logger.addHandler(qh)
 
     return logger
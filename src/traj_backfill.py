@@ -0,0 +1,327 @@
+import os
+import re
+import time
+import queue
+import datetime
+import sqlite3
+import multiprocessing
+import trajectory_scanner
+from trajectory_scanner import TrajScanner, logger
+
+
+class BackfillQueue(object):
+    """
+    SQLite3 backed work queue of (station, month) tasks for the backfill.
+    The queue is stored in a separate database file, so that the workers
+    don't compete with the writer of the trajectory index.
+    """
+
+    def __init__(self, db_config):
+        """
+        Connect/create the queue database.
+
+        Parameters
+        ----------
+        db_config: dict
+        database configuration of the scanner.
+        """
+
+        self.sql_query = db_config['sql_query']
+        self.db_file = os.path.join(
+            db_config['db_path'],
+            trajectory_scanner.config['BACKFILL_QUEUE_FILE']
+        )
+        # transactions are controlled explicitly to claim the tasks atomically
+        self.conn = sqlite3.connect(self.db_file, timeout=60,
+                                    isolation_level=None)
+
+    def create(self, tasks, retryFailed=False):
+        """
+        create the queue and add the tasks which are not in the queue yet.
+        Running tasks of the previous runs are reset to pending.
+
+        Parameters
+        ----------
+        tasks: list
+        (station, month) of the tasks. month is in the format of 'YYYY-mm'.
+
+        Keywords
+        --------
+        retryFailed: bool
+        whether to reset the failed tasks of the previous runs.
+        """
+
+        c = self.conn.cursor()
+        c.execute(self.sql_query['create_backfill_table'])
+        c.execute('BEGIN IMMEDIATE')
+        c.executemany(self.sql_query['insert_backfill_task'], tasks)
+        c.execute(self.sql_query['reset_backfill_tasks'], ('running',))
+        if retryFailed:
+            c.execute(self.sql_query['reset_backfill_tasks'], ('failed',))
+        c.execute('COMMIT')
+        c.close()
+
+    def claim(self, worker):
+        """
+        claim the next pending task.
+
+        Returns
+        -------
+        task: tuple or None
+        (id, station, month). None if no task is pending.
+        """
+
+        c = self.conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute(self.sql_query['select_backfill_task'])
+        task = c.fetchone()
+        if task is not None:
+            c.execute(self.sql_query['claim_backfill_task'], (
+                worker,
+                datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                task[0]))
+        c.execute('COMMIT')
+        c.close()
+
+        return task
+
+    def finish(self, taskId):
+        """
+        mark the task as done.
+        """
+
+        self.conn.execute(self.sql_query['finish_backfill_task'], (
+            datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), taskId))
+
+    def fail(self, taskId, error, maxAttempts):
+        """
+        return the task to the queue, or mark it as failed after maxAttempts.
+        """
+
+        self.conn.execute(self.sql_query['fail_backfill_task'], (
+            maxAttempts,
+            error,
+            datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            taskId))
+
+    def running_tasks(self, worker=None):
+        """
+        id of the running tasks (of a single worker).
+        """
+
+        c = self.conn.execute(
+            self.sql_query['select_running_backfill_tasks'], (worker, worker))
+
+        return [row[0] for row in c.fetchall()]
+
+    def count(self):
+        """
+        number of tasks for each status.
+        """
+
+        c = self.conn.execute(self.sql_query['count_backfill_tasks'])
+
+        return dict(c.fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def list_backfill_tasks(scanner):
+    """
+    list the (station, month) folders in the trajectory root.
+
+    Parameters
+    ----------
+    scanner: TrajScanner
+
+    Returns
+    -------
+    tasks: list
+    (station, month) of the tasks. month is in the format of 'YYYY-mm'.
+    """
+
+    tasks = []
+    for station in scanner.station_index.stations_on_disk:
+        stationPath = os.path.join(
+            trajectory_scanner.config['TRAJECTORY_ROOT'], station)
+        for year in sorted(os.listdir(stationPath)):
+            if not re.fullmatch(r'\d{4}', year):
+                continue
+            for month in sorted(os.listdir(os.path.join(stationPath, year))):
+                if re.fullmatch(r'\d{2}', month):
+                    tasks.append((station, '{}-{}'.format(year, month)))
+
+    return tasks
+
+
+def scan_traj_month(scanner, station, month):
+    """
+    scan the trajectory figures of a single station-month folder.
+
+    Returns
+    -------
+    fileList: list
+    the same as the elements returned by `TrajScanner.scan_traj_files`.
+    """
+
+    monthPath = os.path.join(
+        trajectory_scanner.config['TRAJECTORY_ROOT'],
+        station,
+        month[0:4],
+        month[5:7]
+    )
+
+    fileList = []
+    for day in sorted(os.listdir(monthPath)):
+        if not re.fullmatch(r'\d{2}', day):
+            continue
+        thisDate = datetime.datetime(int(month[0:4]), int(month[5:7]),
+                                     int(day))
+        fileList.extend(scanner.scan_traj_dir(station, thisDate))
+
+    return fileList
+
+
+def backfill_worker(worker, resultQueue):
+    """
+    claim the tasks, scan and parse the figures and send the entries to the
+    writer. The worker stops when no task is pending or running.
+
+    Parameters
+    ----------
+    worker: int
+    id of the worker.
+
+    resultQueue: multiprocessing.Queue
+    (taskId, rows, error) of each task. (None, worker, None) is sent
+    when the worker stops.
+    """
+
+    scanner = TrajScanner()
+    # the index is only read to skip the figures indexed already
+    scanner.db_connect()
+    taskQueue = BackfillQueue(scanner.db_config)
+
+    while True:
+        task = taskQueue.claim(worker)
+        if task is None:
+            # failed tasks of the other workers may return to the queue
+            if taskQueue.running_tasks():
+                time.sleep(1)
+                continue
+            break
+
+        taskId, station, month = task
+        try:
+            fileList = scan_traj_month(scanner, station, month)
+            indexed = scanner.db_query_indexed_imgpaths(os.path.join(
+                trajectory_scanner.config['TRAJECTORY_ROOT'],
+                station, month[0:4], month[5:7]))
+            figBatch = scanner.parse_traj_file_bulk(
+                fileList, readHeader=True, indexed=indexed)
+            rows = scanner.setup_insert_rows_bulk(figBatch)
+            resultQueue.put((taskId, rows, None))
+        except Exception as e:
+            resultQueue.put((taskId, None, repr(e)))
+
+    taskQueue.close()
+    scanner.db_close()
+    resultQueue.put((None, worker, None))
+
+
+def run_backfill(nWorkers=None, retryFailed=False):
+    """
+    re-index the whole trajectory archive with multiple worker processes.
+    The archive is split into (station, month) tasks, which are parsed by
+    the workers and inserted by this process only.
+
+    Keywords
+    --------
+    nWorkers: int
+    number of worker processes. `BACKFILL_WORKERS` is used if it's None.
+
+    retryFailed: bool
+    whether to retry the failed tasks of the previous runs.
+    """
+
+    config = trajectory_scanner.config
+    if nWorkers is None:
+        nWorkers = config['BACKFILL_WORKERS']
+
+    logger.info('Start to backfill the backward trajectory results...')
+
+    scanner = TrajScanner()
+    scanner.db_connect()
+    scanner.db_create_table()
+
+    taskQueue = BackfillQueue(scanner.db_config)
+    taskQueue.create(list_backfill_tasks(scanner), retryFailed=retryFailed)
+    nTotal = sum(taskQueue.count().values())
+
+    resultQueue = multiprocessing.Queue(maxsize=nWorkers * 4)
+    workers = {}
+    for worker in range(nWorkers):
+        workers[worker] = multiprocessing.Process(
+            target=backfill_worker, args=(worker, resultQueue))
+        workers[worker].start()
+
+    startTime = time.time()
+    nInserted = 0
+    activeWorkers = set(workers.keys())
+    while activeWorkers:
+        try:
+            taskId, rows, error = resultQueue.get(timeout=10)
+        except queue.Empty:
+            # release the tasks of the workers which died unexpectedly
+            for worker in list(activeWorkers):
+                if not workers[worker].is_alive():
+                    for deadTaskId in taskQueue.running_tasks(worker):
+                        taskQueue.fail(deadTaskId, 'worker died',
+                                       config['BACKFILL_MAX_ATTEMPTS'])
+                    logger.error('worker {} died.'.format(worker))
+                    activeWorkers.discard(worker)
+            continue
+
+        if taskId is None:
+            activeWorkers.discard(rows)
+            continue
+
+        if error is None:
+            nNew = scanner.db_insert_rows(rows)
+            if nNew < 0:
+                error = 'failure in inserting the entries'
+            else:
+                nInserted += nNew
+                taskQueue.finish(taskId)
+
+        if error is not None:
+            logger.warning('task {id} failed: {error}'.format(
+                id=taskId, error=error))
+            taskQueue.fail(taskId, error, config['BACKFILL_MAX_ATTEMPTS'])
+
+        taskCount = taskQueue.count()
+        logger.info('[{done}/{total}] tasks done, {failed} failed, '
+                    '{n} entries inserted ({rate:.0f} entries/s)'.format(
+                        done=taskCount.get('done', 0),
+                        total=nTotal,
+                        failed=taskCount.get('failed', 0),
+                        n=nInserted,
+                        rate=nInserted / max(time.time() - startTime, 1e-6)))
+
+    for worker in workers.values():
+        worker.join()
+
+    taskCount = taskQueue.count()
+    logger.info('Finish the backfill: {done} tasks done, {failed} failed, '
+                '{n} entries inserted.'.format(
+                    done=taskCount.get('done', 0),
+                    failed=taskCount.get('failed', 0),
+                    n=nInserted))
+
+    taskQueue.close()
+    scanner.db_close()
+
+
+if __name__ == "__main__":
+    run_backfill()
@@ -0,0 +1,311 @@
+import os
+import json
+import zlib
+import datetime
+import sqlite3
+import threading
+import functools
+from sqlite3 import Error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+import trajectory_scanner
+from trajectory_scanner import TrajScanner, logger
+
+
+class TrajQueryService(object):
+    """
+    Read-only query service over the trajectory index. The results are kept
+    in a LRU cache, which is cleared when the database was modified by the
+    scanner.
+    """
+
+    def __init__(self, scanner=None, cacheSize=256):
+        """
+        open the sqlite3 database in read-only mode.
+
+        Keywords
+        --------
+        scanner: TrajScanner
+        scanner providing the database config and the station alias index.
+
+        cacheSize: int
+        maximum number of cached query results.
+        """
+
+        if scanner is None:
+            scanner = TrajScanner()
+        self.scanner = scanner
+        self.lock = threading.Lock()
+        self.cached_query = functools.lru_cache(maxsize=cacheSize)(
+            self.db_query_figs)
+        self.db_connect()
+
+    def db_connect(self):
+        """
+        Connect the SQLite3 database in read-only mode.
+        """
+
+        db_file = os.path.join(
+            self.scanner.db_config['db_path'],
+            self.scanner.db_config['db_filename']
+        )
+        self.conn = sqlite3.connect(
+            'file:{}?mode=ro'.format(db_file), uri=True,
+            check_same_thread=False)
+        self.data_version = None
+        self.version = ''
+        self.last_modified = None
+        logger.info('Serve the database:\n{}'.format(db_file))
+
+    def refresh(self):
+        """
+        clear the cache if the database was modified by another connection.
+        """
+
+        if self.scanner.reload_config():
+            self.conn.close()
+            self.db_connect()
+
+        dataVersion = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if dataVersion == self.data_version:
+            return
+
+        self.cached_query.cache_clear()
+        lastInsertTime, lastUploadTime, nRows = self.conn.execute(
+            self.scanner.db_config['sql_query']['select_last_modify']
+            ).fetchone()
+        # the figures updated in place only change the upload_time
+        self.version = '{insert}-{upload}-{n}'.format(
+            insert=(lastInsertTime or '').replace(' ', 'T'),
+            upload=(lastUploadTime or '').replace(' ', 'T'),
+            n=nRows)
+        # insert_time is the local time and upload_time is UTC
+        timestamps = []
+        if lastInsertTime is not None:
+            timestamps.append(datetime.datetime.strptime(
+                lastInsertTime, '%Y-%m-%d %H:%M:%S').timestamp())
+        if lastUploadTime is not None:
+            timestamps.append(datetime.datetime.strptime(
+                lastUploadTime, '%Y-%m-%d %H:%M:%S').replace(
+                    tzinfo=datetime.timezone.utc).timestamp())
+        self.last_modified = max(timestamps, default=None)
+        self.data_version = dataVersion
+
+    def db_query_figs(self, gdas1Station, category, startTime, stopTime,
+                      page, pageSize):
+        """
+        query the trajectory figures.
+
+        Returns
+        -------
+        result: dict
+            total: int
+            page: int
+            page_size: int
+            figs: list of dict
+        """
+
+        params = (gdas1Station, gdas1Station, category, category,
+                  startTime, stopTime)
+
+        c = self.conn.cursor()
+        c.execute(self.scanner.db_config['sql_query']['count_figs'], params)
+        total = c.fetchone()[0]
+        c.execute(self.scanner.db_config['sql_query']['select_figs'],
+                  params + (pageSize, (page - 1) * pageSize))
+        columns = [item[0] for item in c.description]
+        figs = [dict(zip(columns, row)) for row in c.fetchall()]
+        c.close()
+
+        return {
+            'total': total,
+            'page': page,
+            'page_size': pageSize,
+            'figs': figs
+        }
+
+    def query(self, queryArgs):
+        """
+        query the trajectory figures with the arguments of the request.
+
+        Parameters
+        ----------
+        queryArgs: dict
+            station: str
+            PollyNET or GDAS1 station name.
+
+            category: int
+            category of the trajectory results.
+
+            start: str
+            stop: str
+            time range of the figures, 'YYYY-mm-dd' or 'YYYY-mm-ddTHH:MM:SS'.
+
+            page: int
+            page_size: int
+
+        Returns
+        -------
+        result: dict
+        returned by `db_query_figs`.
+
+        version: str
+        latest insert_time, latest upload_time and number of entries of the
+        database.
+
+        lastModified: float or None
+        POSIX timestamp of the latest insert or update.
+        """
+
+        station = queryArgs.get('station')
+        gdas1Station = None
+        if station is not None:
+            stationIndex = self.scanner.station_index
+            if station in stationIndex.pollynet_to_gdas1:
+                gdas1Station = stationIndex.pollynet_to_gdas1[station]
+            elif station in stationIndex.gdas1_to_pollynet:
+                gdas1Station = station
+            else:
+                raise ValueError('unknown station {}'.format(station))
+
+        category = queryArgs.get('category')
+        if category is not None:
+            category = int(category)
+
+        startTime = parse_query_time(queryArgs.get('start'),
+                                     datetime.datetime(1970, 1, 1))
+        stopTime = parse_query_time(queryArgs.get('stop'),
+                                    datetime.datetime.max)
+        if queryArgs.get('stop') and (len(queryArgs.get('stop')) == 10):
+            # include the whole stop day
+            stopTime = stopTime.replace(hour=23, minute=59, second=59)
+
+        page = int(queryArgs.get('page', 1))
+        pageSize = min(int(queryArgs.get('page_size', 100)), 1000)
+        if (page < 1) or (pageSize < 1):
+            raise ValueError('page and page_size must be positive')
+
+        with self.lock:
+            self.refresh()
+            result = self.cached_query(
+                gdas1Station, category,
+                startTime.strftime('%Y-%m-%d %H:%M:%S'),
+                stopTime.strftime('%Y-%m-%d %H:%M:%S'),
+                page, pageSize)
+
+            return result, self.version, self.last_modified
+
+
+def parse_query_time(timeStr, default):
+    """
+    convert the time string of the query to datetime obj.
+    """
+
+    if not timeStr:
+        return default
+
+    for timeFormat in ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d']:
+        try:
+            return datetime.datetime.strptime(timeStr, timeFormat)
+        except ValueError:
+            pass
+
+    raise ValueError('invalid time {}'.format(timeStr))
+
+
+class TrajQueryHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for `GET /figs`.
+    """
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/figs':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        queryArgs = {key: value[0]
+                     for key, value in parse_qs(url.query).items()}
+
+        try:
+            result, version, lastModifiedTime = self.service.query(queryArgs)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Error as e:
+            logger.error(e)
+            self.send_json(500, {'error': 'database error'})
+            return
+
+        # the validators only depend on the latest insert or update
+        etag = '"{version}-{query:08x}"'.format(
+            version=version,
+            query=zlib.crc32(url.query.encode('utf-8')))
+        lastModified = None
+        if lastModifiedTime is not None:
+            lastModified = formatdate(lastModifiedTime, usegmt=True)
+
+        notModified = False
+        if 'If-None-Match' in self.headers:
+            notModified = self.headers['If-None-Match'] == etag
+        elif ('If-Modified-Since' in self.headers) and \
+                (lastModified is not None):
+            try:
+                notModified = parsedate_to_datetime(
+                    self.headers['If-Modified-Since']).timestamp() >= \
+                    int(lastModifiedTime)
+            except (TypeError, ValueError):
+                pass
+
+        if notModified:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            if lastModified is not None:
+                self.send_header('Last-Modified', lastModified)
+            self.end_headers()
+            return
+
+        self.send_json(200, result, {'ETag': etag,
+                                     'Last-Modified': lastModified})
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            if value is not None:
+                self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def run_query_service():
+    """
+    serve the trajectory index over HTTP.
+    """
+
+    config = trajectory_scanner.config
+
+    TrajQueryHandler.service = TrajQueryService()
+    server = ThreadingHTTPServer(
+        (config['QUERY_HOST'], config['QUERY_PORT']), TrajQueryHandler)
+    logger.info('Start the query service at http://{host}:{port}/figs'.
+                format(host=config['QUERY_HOST'], port=config['QUERY_PORT']))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run_query_service()
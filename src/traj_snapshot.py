@@ -0,0 +1,277 @@
+import os
+import json
+import gzip
+import datetime
+import argparse
+import trajectory_scanner
+from trajectory_scanner import TrajScanner, logger
+
+SNAPSHOT_FORMAT = 'traj_snapshot'
+SNAPSHOT_VERSION = 1
+
+
+def export_snapshot(snapshotFile):
+    """
+    export the trajectory index to a snapshot.
+
+    The snapshot is a gzip compressed file with one JSON document per line.
+    The first line is the header with the format version, the columns and
+    the manifest of the day folders {relative path: mtime}. The following
+    lines are the rows sorted by imgpath.
+
+    Parameters
+    ----------
+    snapshotFile: str
+    absolute path of the snapshot.
+    """
+
+    logger.info('Start to export the trajectory index...')
+
+    scanner = TrajScanner()
+    scanner.db_connect()
+    scanner.db_create_table()
+
+    c = scanner.conn.cursor()
+    c.execute('PRAGMA table_info({})'.format(
+        scanner.db_config['table_name']))
+    columns = [row[1] for row in c.fetchall()]
+
+    # modification time of the day folders at the time of the export
+    trajRoot = trajectory_scanner.config['TRAJECTORY_ROOT']
+    manifest = {}
+    c.execute(scanner.db_config['sql_query']['select_imgpaths'])
+    for (imgpath, ) in c.fetchall():
+        dayPath = os.path.dirname(imgpath)
+        dayKey = os.path.relpath(dayPath, trajRoot)
+        if dayKey not in manifest:
+            try:
+                manifest[dayKey] = os.stat(dayPath).st_mtime
+            except OSError:
+                manifest[dayKey] = None
+
+    c.execute(scanner.db_config['sql_query']['select_snapshot_rows'].format(
+        columns=','.join(columns)))
+
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'trajectory_root': trajRoot,
+        'columns': columns,
+        'manifest': manifest
+    }
+
+    nRows = 0
+    with gzip.open(snapshotFile, 'wt', encoding='utf-8') as fh:
+        fh.write(json.dumps(header) + '\n')
+        while True:
+            rows = c.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                fh.write(json.dumps(row) + '\n')
+            nRows += len(rows)
+
+    c.close()
+    scanner.db_close()
+
+    logger.info('Export {n:,} entries and {nDay:,} day folders to {file}'.
+                format(n=nRows, nDay=len(manifest), file=snapshotFile))
+
+
+def import_snapshot(snapshotFile, catchUp=True):
+    """
+    load the trajectory index from a snapshot into an empty database. The
+    rows are loaded in bulk before the index of imgpath is built. Afterwards
+    the day folders which were modified or created after the export are
+    scanned.
+
+    Parameters
+    ----------
+    snapshotFile: str
+    absolute path of the snapshot.
+
+    Keywords
+    --------
+    catchUp: bool
+    whether to scan the day folders modified after the export.
+
+    Returns
+    -------
+    header: dict
+    header of the snapshot.
+    """
+
+    logger.info('Start to import the trajectory index...')
+
+    scanner = TrajScanner()
+    scanner.db_connect()
+    sqlQuery = scanner.db_config['sql_query']
+
+    with gzip.open(snapshotFile, 'rt', encoding='utf-8') as fh:
+        header = json.loads(fh.readline())
+        if (header.get('format') != SNAPSHOT_FORMAT) or \
+           (header.get('version') != SNAPSHOT_VERSION):
+            raise ValueError('unsupported snapshot {format} version {ver}'.
+                             format(format=header.get('format'),
+                                    ver=header.get('version')))
+
+        c = scanner.conn.cursor()
+        c.execute(sqlQuery['create_traj_table_bulk'])
+        c.execute('SELECT COUNT(*) FROM {}'.format(
+            scanner.db_config['table_name']))
+        if c.fetchone()[0] > 0:
+            raise ValueError('the snapshot can only be imported into an '
+                             'empty database.')
+
+        # the archive may be mounted at another path on the new host
+        oldRoot = os.path.join(
+            os.path.normpath(header['trajectory_root']), '')
+        newRoot = os.path.join(os.path.normpath(
+            trajectory_scanner.config['TRAJECTORY_ROOT']), '')
+        iImgpath = header['columns'].index('imgpath')
+        if oldRoot != newRoot:
+            logger.warning('Replace the trajectory root {old} of the '
+                           'snapshot with {new}'.format(old=oldRoot,
+                                                        new=newRoot))
+
+        # the index will be built after loading the rows
+        c.execute('PRAGMA journal_mode=OFF')
+        c.execute('PRAGMA synchronous=OFF')
+        try:
+            insertQuery = sqlQuery['insert_snapshot_row'].format(
+                columns=','.join(header['columns']),
+                values=','.join(['?'] * len(header['columns'])))
+
+            nRows = 0
+            nOutside = 0
+            rows = []
+            for line in fh:
+                row = json.loads(line)
+                if oldRoot != newRoot:
+                    if row[iImgpath].startswith(oldRoot):
+                        row[iImgpath] = newRoot + \
+                            row[iImgpath][len(oldRoot):]
+                    else:
+                        nOutside += 1
+                rows.append(row)
+                if len(rows) >= 10000:
+                    c.executemany(insertQuery, rows)
+                    nRows += len(rows)
+                    rows = []
+            c.executemany(insertQuery, rows)
+            nRows += len(rows)
+            scanner.conn.commit()
+
+            c.execute(sqlQuery['create_traj_index'])
+        except Exception as e:
+            # without journal the partial load can't be rolled back. Drop
+            # the table, so that the import can be retried.
+            logger.error('Failure in importing the snapshot: {}'.format(e))
+            scanner.conn.rollback()
+            c.execute(sqlQuery['drop_traj_table'])
+            scanner.conn.commit()
+            raise
+        finally:
+            c.execute('PRAGMA synchronous=FULL')
+            c.execute('PRAGMA journal_mode=DELETE')
+            c.close()
+            scanner.conn.commit()
+
+    # append the columns missing in the older snapshots
+    scanner.db_create_table()
+
+    logger.info('Import {n:,} entries from {file}'.format(
+        n=nRows, file=snapshotFile))
+    if nOutside > 0:
+        logger.warning('{:,} entries are outside of the trajectory root of '
+                       'the snapshot and were kept unchanged.'.format(
+                           nOutside))
+
+    if catchUp:
+        catch_up_snapshot(scanner, header)
+
+    scanner.db_close()
+
+    return header
+
+
+def catch_up_snapshot(scanner, header):
+    """
+    scan the day folders which were modified or created after the export of
+    the snapshot.
+
+    Parameters
+    ----------
+    scanner: TrajScanner
+    connected scanner.
+
+    header: dict
+    header of the snapshot.
+    """
+
+    trajRoot = trajectory_scanner.config['TRAJECTORY_ROOT']
+    created = datetime.datetime.strptime(header['created'],
+                                         '%Y-%m-%d %H:%M:%S')
+
+    # the day folders since the export
+    fileList = scanner.scan_traj_files(
+        datetime.datetime.now(),
+        elapse_time=datetime.datetime.now() - created +
+        datetime.timedelta(days=1))
+    nDay = 0
+
+    # the day folders of the snapshot modified after the export
+    for dayKey, mtime in header['manifest'].items():
+        dayPath = os.path.join(trajRoot, dayKey)
+        try:
+            if os.stat(dayPath).st_mtime == mtime:
+                continue
+        except OSError:
+            continue
+
+        # only the station/year/month/day folders under the trajectory root
+        dayParts = os.path.normpath(dayKey).split(os.sep)
+        if (len(dayParts) != 4) or \
+           (not all(part.isdigit() for part in dayParts[1:])):
+            continue
+        station, year, month, day = dayParts
+        if station not in scanner.station_index.gdas1_to_pollynet:
+            continue
+        fileList.extend(scanner.scan_traj_dir(
+            station, datetime.datetime(int(year), int(month), int(day))))
+        nDay += 1
+
+    logger.info('{} modified day folders since the export.'.format(nDay))
+
+    # only the new figures are read, the rows of the snapshot are kept
+    indexed = set()
+    for dayPath in set(item['path'] for item in fileList):
+        indexed |= scanner.db_query_indexed_imgpaths(dayPath)
+    figBatch = scanner.parse_traj_file_bulk(
+        fileList, readHeader=True, indexed=indexed)
+    nNew = scanner.db_insert_rows(scanner.setup_insert_rows_bulk(figBatch))
+
+    logger.info('Catch up {n:,} entries since {time}'.format(
+        n=max(nNew, 0), time=header['created']))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Export/import the snapshot of the trajectory index.')
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('snapshot', help='path of the snapshot file.')
+    parser.add_argument(
+        '--no-catch-up', action='store_true',
+        help='skip the scan of the day folders modified after the export.')
+    args = parser.parse_args()
+
+    if args.action == 'export':
+        export_snapshot(args.snapshot)
+    else:
+        import_snapshot(args.snapshot, catchUp=not args.no_catch_up)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
 import os
 import sys
 import datetime
+import time
 import toml
 import sqlite3
 import MySQLdb
 import glob
 import re
+import mmap
+import hashlib
+import struct
+import io
+import argparse
+import cProfile
+import pstats
+import functools
+import numpy as np
 from sqlite3 import Error
 from logger_init import logger_init
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 
 SCANNER_CONFIG_FILE = 'scanner_config.toml'
 PROJECTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -20,14 +35,441 @@ configFullPath = os.path.join(PROJECTDIR, 'config', SCANNER_CONFIG_FILE)
 with open(configFullPath, 'r', encoding='utf-8') as fh:
     config = toml.loads(fh.read())
 
+# defaults of the keys added after the first edition, so that the existing
+# configuration files keep working
+SCANNER_CONFIG_DEFAULTS = {
+    'TRAJ_FIG_HOURS': [0, 6, 12, 18],
+    'GAP_SCAN_DAYS': 30,
+    'MAX_GAP_RESCAN': 50,
+    'WATCH_SCAN_DAYS': 1,
+    'WATCH_INTERVAL': 600,
+}
+
 # define the logger for producing the logs
 logger = logger_init(
-    datetime.datetime.now(),
     os.path.join(PROJECTDIR, 'log'),
     force=True,
-    mode=config['LOGMODE']
+    mode=config['LOGMODE'],
+    maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+    backupCount=config.get('LOG_BACKUP_COUNT', 10),
+    retentionDays=config.get('LOG_RETENTION_DAYS', 90)
 )
 
+###############################################################################
+#                        trajectory filename patterns                         #
+###############################################################################
+# (category, pattern) pairs, the category table can be found in readme.md
+TRAJ_FIG_PATTERNS = [
+    (10, re.compile(
+        r"(?P<date>\d{8})_(?P<hour>\d{2})_(?P<height>\d{5})" +
+        "_trajectories_prof.png")),
+    (9, re.compile(
+        r"(?P<date>\d{8})_(?P<hour>\d{2})_(?P<height>\d{5})" +
+        "_trajectories_map.png")),
+    (5, re.compile(
+        r"(?P<date>\d{8})_.*-land-use-abs-occ-ens-below2.0km.png")),
+    (6, re.compile(
+        r"(?P<date>\d{8})_.*-land-use-abs-occ-ens-below5.0km.png")),
+    (7, re.compile(
+        r"(?P<date>\d{8})_.*-land-use-abs-occ-ens-below8.0km.png")),
+    (8, re.compile(
+        r"(?P<date>\d{8})_.*-land-use-abs-occ-ens-belowmd.png")),
+    (1, re.compile(
+        r"(?P<date>\d{8})_.*-geonames-abs-region-ens-below2.0km.png")),
+    (2, re.compile(
+        r"(?P<date>\d{8})_.*-geonames-abs-region-ens-below5.0km.png")),
+    (3, re.compile(
+        r"(?P<date>\d{8})_.*-geonames-abs-region-ens-below8.0km.png")),
+    (4, re.compile(
+        r"(?P<date>\d{8})_.*-geonames-abs-region-ens-belowmd.png")),
+]
+# categories produced for every hourly slot (trajectories_map/prof)
+TRAJ_HOURLY_CATEGORIES = (9, 10)
+
+
+def traj_fig_slot(filename):
+    """
+    find the product slot of a trajectory figure.
+
+    Parameters
+    ----------
+    filename: str
+    basename of the trajectory figure.
+
+    Returns
+    -------
+    slot: tuple or None
+    (category, hour) of the figure. hour is None for the daily products.
+    None is returned if the filename is not a trajectory figure.
+    """
+
+    for category, pattern in TRAJ_FIG_PATTERNS:
+        res = pattern.match(filename)
+        if res:
+            if category in TRAJ_HOURLY_CATEGORIES:
+                return (category, int(res.group('hour')))
+            else:
+                return (category, None)
+
+    return None
+
+
+def expected_traj_slots(hours):
+    """
+    the full product set of a single station-day.
+
+    Parameters
+    ----------
+    hours: list
+    hours of the hourly trajectory figures, e.g. `TRAJ_FIG_HOURS`.
+
+    Returns
+    -------
+    slots: set
+    (category, hour) of all the expected figures.
+    """
+
+    slots = set()
+    for category, pattern in TRAJ_FIG_PATTERNS:
+        if category in TRAJ_HOURLY_CATEGORIES:
+            for hour in hours:
+                slots.add((category, hour))
+        else:
+            slots.add((category, None))
+
+    return slots
+
+
+# columns added to trajectory_figs after the first edition, which will be
+# appended to the existing tables
+TRAJ_TABLE_NEW_COLUMNS = [
+    ('file_size', 'INT'),
+    ('content_hash', 'TEXT'),
+    ('width', 'INT'),
+    ('height', 'INT'),
+    ('registered_hash', 'TEXT'),
+]
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def file_fingerprint(file, chunkSize=1024 * 1024):
+    """
+    content fingerprint of a file.
+
+    Parameters
+    ----------
+    file: str
+    absolute path of the file.
+
+    Keywords
+    --------
+    chunkSize: int
+    number of bytes to be hashed at once.
+
+    Returns
+    -------
+    fingerprint: str
+    hex digest with the hash algorithm as prefix, e.g. 'xxh3:...'. xxhash is
+    used if it's installed, otherwise blake2b.
+    """
+
+    if xxhash is not None:
+        algorithm = 'xxh3'
+        h = xxhash.xxh3_128()
+    else:
+        algorithm = 'blake2b'
+        h = hashlib.blake2b(digest_size=16)
+
+    with open(file, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        # empty files can not be mapped
+        if size > 0:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset in range(0, size, chunkSize):
+                    h.update(mm[offset:(offset + chunkSize)])
+
+    return '{}:{}'.format(algorithm, h.hexdigest())
+
+
+@functools.lru_cache(maxsize=4096)
+def format_time(timeObj, timeFormat='%Y-%m-%d %H:%M:%S'):
+    """
+    format the start or stop time of the figures. The results are memoized,
+    as the same start and stop times are formatted for all the figures (and
+    aliases) of a day. Don't use it for the unique times, e.g. upload_time.
+    """
+
+    return timeObj.strftime(timeFormat)
+
+
+def datetime64_to_str(times):
+    """
+    format the datetime64 array as 'YYYY-mm-dd HH:MM:SS'. Each unique value
+    is only formatted once.
+
+    Parameters
+    ----------
+    times: numpy.ndarray
+    datetime64 array.
+
+    Returns
+    -------
+    timeStrs: numpy.ndarray
+    """
+
+    uniqueTimes, inverse = np.unique(times, return_inverse=True)
+    uniqueTimeStrs = np.char.replace(
+        np.datetime_as_string(uniqueTimes, unit='s'), 'T', ' ')
+
+    return uniqueTimeStrs[inverse]
+
+
+def entry_to_tuple(item):
+    """
+    convert the entry to the values of the `insert_traj_entry` query.
+    """
+
+    return (
+        item['imgpath'],
+        item['category'],
+        item['pollynet_station'],
+        item['gdas1_station'],
+        item['ending_height'],
+        format_time(item['start_time']),
+        format_time(item['stop_time']),
+        item['upload_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        item.get('file_size'),
+        item.get('content_hash'),
+        item.get('width'),
+        item.get('height')
+    )
+
+
+def read_png_size(file):
+    """
+    read the image size from the IHDR chunk of a PNG file without decoding
+    the image.
+
+    Parameters
+    ----------
+    file: str
+    absolute path of the PNG file.
+
+    Returns
+    -------
+    width: int or None
+    height: int or None
+    None is returned if the file is not a valid PNG file.
+    """
+
+    # signature (8 bytes) + chunk length (4 bytes) + chunk type (4 bytes) +
+    # width (4 bytes) + height (4 bytes)
+    with open(file, 'rb') as fh:
+        header = fh.read(24)
+
+    if (len(header) < 24) or (header[0:8] != PNG_SIGNATURE) or \
+       (header[12:16] != b'IHDR'):
+        return None, None
+
+    return struct.unpack('>II', header[16:24])
+
+
+class StationAliasIndex(object):
+    """
+    Bidirectional index between the GDAS1 station names and the PollyNET
+    station names, built once from the station name lookup table.
+    """
+
+    def __init__(self, station_name_table, trajRoot):
+        """
+        build and validate the index.
+
+        Parameters
+        ----------
+        station_name_table: dict
+        content of the station name lookup table.
+
+        trajRoot: str
+        root folder of the trajectory results.
+        """
+
+        self.gdas1_to_pollynet = {}
+        self.pollynet_to_gdas1 = {}
+
+        for gdas1Station, item in station_name_table.items():
+            if (not isinstance(item, dict)) or \
+               ('name_PollyNET' not in item):
+                raise ValueError(
+                    'no name_PollyNET for station {}'.format(gdas1Station))
+
+            pollynetStationList = item['name_PollyNET']
+            if isinstance(pollynetStationList, str):
+                pollynetStationList = [pollynetStationList]
+            if len(pollynetStationList) == 0:
+                raise ValueError(
+                    'empty name_PollyNET for station {}'.format(gdas1Station))
+
+            for pollynetStation in pollynetStationList:
+                if pollynetStation in self.pollynet_to_gdas1:
+                    raise ValueError(
+                        'duplicate PollyNET station {polly} for {st1} and '
+                        '{st2}'.format(
+                            polly=pollynetStation,
+                            st1=self.pollynet_to_gdas1[pollynetStation],
+                            st2=gdas1Station))
+                self.pollynet_to_gdas1[pollynetStation] = gdas1Station
+
+            self.gdas1_to_pollynet[gdas1Station] = list(pollynetStationList)
+
+        # list the trajectory root only once instead of probing the folders
+        # of every station for every day
+        try:
+            folderList = os.listdir(trajRoot)
+        except OSError as e:
+            logger.warning(e)
+            folderList = []
+
+        self.stations_on_disk = sorted(
+            set(folderList) & set(self.gdas1_to_pollynet.keys()))
+
+        for folder in sorted(set(folderList) -
+                             set(self.gdas1_to_pollynet.keys())):
+            if os.path.isdir(os.path.join(trajRoot, folder)):
+                logger.warning(
+                    'unknown station folder {} is not in the lookup table.'.
+                    format(folder))
+
+        logger.debug('{nDisk} of {nTable} stations exist in {root}'.format(
+            nDisk=len(self.stations_on_disk),
+            nTable=len(self.gdas1_to_pollynet),
+            root=trajRoot))
+
+
+class ConfigManager(object):
+    """
+    Configuration manager for long-running processes. The scanner
+    configuration, the database configuration and the station name lookup
+    table are reloaded together when any of them was modified.
+    """
+
+    def __init__(self):
+        """
+        load and validate the configurations.
+        """
+
+        self.mtimes = {}
+        self.failed_mtimes = {}
+        self.load()
+
+    def watched_files(self):
+        """
+        files (and folders) whose modification indicates a reload.
+        """
+
+        return [
+            configFullPath,
+            os.path.join(PROJECTDIR, 'config', config['DB_CONFIG_FILE']),
+            os.path.join(PROJECTDIR, 'config', config['STATION_NAME_FILE']),
+            # a new station folder changes the mtime of the trajectory root
+            config['TRAJECTORY_ROOT']
+        ]
+
+    def get_mtimes(self):
+        """
+        modification time of the watched files.
+        """
+
+        mtimes = {}
+        for file in self.watched_files():
+            try:
+                mtimes[file] = os.stat(file).st_mtime
+            except OSError:
+                mtimes[file] = None
+
+        return mtimes
+
+    def load(self):
+        """
+        load and validate all the configurations. The current configuration
+        is only replaced if all of them are valid.
+        """
+
+        global config
+
+        mtimes = self.get_mtimes()
+
+        with open(configFullPath, 'r', encoding='utf-8') as fh:
+            newConfig = toml.loads(fh.read())
+        for key in ['TRAJECTORY_ROOT', 'STATION_NAME_FILE', 'DB_CONFIG_FILE',
+                    'INTERVAL_TRAJ_FIG']:
+            if key not in newConfig:
+                raise KeyError('{} is missing in {}'.format(
+                    key, configFullPath))
+        datetime.datetime.strptime(newConfig['INTERVAL_TRAJ_FIG'], '%H:%M:%S')
+        for key, value in SCANNER_CONFIG_DEFAULTS.items():
+            newConfig.setdefault(key, value)
+        # keys read by the long-running loops after the reload
+        for key in ['GAP_SCAN_DAYS', 'MAX_GAP_RESCAN', 'WATCH_SCAN_DAYS']:
+            if not isinstance(newConfig[key], int):
+                raise TypeError('{} must be an integer'.format(key))
+        if not isinstance(newConfig['WATCH_INTERVAL'], (int, float)):
+            raise TypeError('WATCH_INTERVAL must be a number')
+        if (not isinstance(newConfig['TRAJ_FIG_HOURS'], list)) or \
+           (not all(isinstance(hour, int)
+                    for hour in newConfig['TRAJ_FIG_HOURS'])):
+            raise TypeError('TRAJ_FIG_HOURS must be a list of hours')
+        expectedSlots = expected_traj_slots(newConfig['TRAJ_FIG_HOURS'])
+
+        dbConfig = toml.load(
+            os.path.join(PROJECTDIR, 'config', newConfig['DB_CONFIG_FILE']))
+        for key in ['db_path', 'db_filename', 'sql_query']:
+            if key not in dbConfig:
+                raise KeyError('{} is missing in the database config'.
+                               format(key))
+
+        lookupTFile = os.path.join(
+            PROJECTDIR, 'config', newConfig['STATION_NAME_FILE'])
+        with open(lookupTFile, 'r', encoding='utf-8') as fh:
+            stationNameTable = toml.loads(fh.read())
+        stationIndex = StationAliasIndex(
+            stationNameTable, newConfig['TRAJECTORY_ROOT'])
+
+        # replace the configurations after everything was validated
+        config = newConfig
+        self.db_config = dbConfig
+        self.station_name_table = stationNameTable
+        self.station_index = stationIndex
+        self.expected_slots = expectedSlots
+        self.mtimes = mtimes
+
+    def check(self):
+        """
+        reload the configurations if any of the watched files was modified.
+
+        Returns
+        -------
+        flag: bool
+        True if the configurations were reloaded.
+        """
+
+        mtimes = self.get_mtimes()
+        if (mtimes == self.mtimes) or (mtimes == self.failed_mtimes):
+            return False
+
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError, TypeError,
+                toml.TomlDecodeError) as e:
+            # keep the current configurations and wait for the next change
+            logger.error('Failure in reloading the configurations: {}'.
+                         format(e))
+            self.failed_mtimes = mtimes
+            return False
+
+        logger.info('Reload the configurations.')
+        return True
+
 
 class TrajScanner(object):
     """
@@ -35,20 +477,46 @@ class TrajScanner(object):
     sqlite3 database.
     """
 
-    def __init__(self):
+    def __init__(self, config_manager=None):
         """
         initialize the sqlite3 database.
+
+        Keywords
+        --------
+        config_manager: ConfigManager
+        shared configuration manager. A new one will be created if it's None.
         """
 
         # load configuration
-        configFile = os.path.join(
-            PROJECTDIR, 'config', config['DB_CONFIG_FILE'])
-        self.db_config = toml.load(configFile)
+        if config_manager is None:
+            config_manager = ConfigManager()
+        self.config_manager = config_manager
+        self.apply_config()
 
-        lookupTFile = os.path.join(
-            PROJECTDIR, 'config', config['STATION_NAME_FILE'])
-        with open(lookupTFile, 'r', encoding='utf-8') as fh:
-            self.station_name_table = toml.loads(fh.read())
+    def apply_config(self):
+        """
+        take over the configurations from the configuration manager.
+        """
+
+        self.db_config = self.config_manager.db_config
+        self.station_name_table = self.config_manager.station_name_table
+        self.station_index = self.config_manager.station_index
+
+    def reload_config(self):
+        """
+        reload the configurations if they were modified.
+
+        Returns
+        -------
+        flag: bool
+        True if the configurations were reloaded.
+        """
+
+        if self.config_manager.check():
+            self.apply_config()
+            return True
+
+        return False
 
     def db_connect(self):
         """
@@ -87,6 +555,21 @@ class TrajScanner(object):
             c.execute(
                 self.db_config['sql_query']['create_traj_table']
             )
+            c.execute(
+                self.db_config['sql_query']['create_gap_rescan_table']
+            )
+
+            # upgrade the tables created by the previous editions
+            c.execute('PRAGMA table_info({})'.format(
+                self.db_config['table_name']))
+            columns = [row[1] for row in c.fetchall()]
+            for column, columnType in TRAJ_TABLE_NEW_COLUMNS:
+                if column not in columns:
+                    c.execute('ALTER TABLE {table} ADD COLUMN {col} {type}'.
+                              format(table=self.db_config['table_name'],
+                                     col=column, type=columnType))
+                    logger.info('Add the column {} to the table.'.
+                                format(column))
             self.conn.commit()
 
             logger.info('Create the table successfully.')
@@ -116,109 +599,568 @@ class TrajScanner(object):
             gdas1_station: str
             GDAS1 station name associated with the trajectories.
 
-            ending_height: float
-            ending height for the trajectories.
-            (details can be found in readme.md)
+            ending_height: float
+            ending height for the trajectories.
+            (details can be found in readme.md)
+
+            start_time: datetime obj
+            start time of the results.
+
+            stop_time: datetime obj
+            stop time of the results.
+
+            upload_time: datetime obj
+            uploading time of the results.
+
+            file_size: int
+            size of the figure in bytes.
+
+            content_hash: str
+            content fingerprint of the figure (optional).
+
+            width: int
+            width of the figure in pixels (optional).
+
+            height: int
+            height of the figure in pixels (optional).
+
+        History
+        -------
+        2019-10-01. First edition by Zhenping.
+        """
+
+        if type(entry) is dict:
+            entry = [entry]
+
+        nDuplicate = 0
+        for item in entry:
+            single_entry_tuple = entry_to_tuple(item)
+
+            try:
+                c = self.conn.cursor()
+                c.execute(self.db_config['sql_query']
+                          ['insert_traj_entry'], single_entry_tuple)
+                self.conn.commit()
+                c.close()
+
+            except sqlite3.IntegrityError:
+                # the figure exists already
+                nDuplicate += 1
+                logger.debug('duplicate: {}'.format(single_entry_tuple[0]))
+
+            except Error as e:
+                # the failed figure is logged with the error, as the
+                # warnings and errors are never aggregated
+                logger.error('{error}: {imgpath}'.format(
+                    error=e, imgpath=single_entry_tuple[0]))
+
+        if nDuplicate > 0:
+            logger.info('{:,} duplicates skipped.'.format(nDuplicate))
+
+        return True
+
+    def db_insert_rows(self, rows):
+        """
+        insert the formatted rows in a single transaction. The rows whose
+        imgpath exists already will be skipped.
+
+        Parameters
+        ----------
+        rows: list
+        values of the `insert_traj_entry` query, returned by
+        `entry_to_tuple` or `setup_insert_rows_bulk`.
+
+        Returns
+        -------
+        nInserted: int
+        number of inserted rows. -1 for failure.
+        """
+
+        try:
+            nChanges = self.conn.total_changes
+            c = self.conn.cursor()
+            c.executemany(
+                self.db_config['sql_query']['insert_traj_entry_ignore'], rows)
+            nInserted = self.conn.total_changes - nChanges
+            self.conn.commit()
+            c.close()
+        except Error as e:
+            logger.error(e)
+            self.conn.rollback()
+            return -1
+
+        return nInserted
+
+    def db_drop_table(self):
+        """
+        delete the table.
+        """
+
+        if self.conn is None:
+            logger.warn('database does not exist.')
+            return False
+
+        try:
+            c = self.conn.cursor()
+            c.execute(
+                self.db_config['sql_query']['drop_traj_table']
+            )
+            self.conn.commit()
+
+            logger.info('Delete the table successfully.')
+        except Error as e:
+            logger.error(e)
+            return False
+
+        return True
+
+    def db_delete_entry(self, entry_dict):
+        """
+        delete entry.
+
+        Parameters
+        ----------
+        entry_dict: dict
+            filename: str
+            filename of the trajectory results.
+
+            pollynet_station: str
+            pollynet station name.
+
+        History
+        -------
+        2019-10-01. First edition by Zhenping
+        """
+
+        try:
+            c = self.conn.cursor()
+            c.execute(
+                        self.db_config['sql_query']['delete_entry'],
+                        (
+                            entry_dict['imgpath'],
+                            entry_dict['pollynet_station']
+                        )
+                    )
+            self.conn.commit()
+            logger.info(
+                'Delete the entries with the searching arguments {}'.
+                format(str(entry_dict))
+                )
+
+            c.close()
+        except Error as e:
+            logger.error(e)
+            return False
+
+        return True
+
+    def db_query_fingerprints(self):
+        """
+        query the cached file status of the indexed figures.
+
+        Returns
+        -------
+        fingerprints: dict
+        {imgpath: (file_size, upload_time, content_hash)}
+        """
+
+        fingerprints = {}
+
+        try:
+            c = self.conn.cursor()
+            c.execute(self.db_config['sql_query']['select_fingerprints'])
+            for imgpath, fileSize, uploadTime, contentHash in c.fetchall():
+                fingerprints[imgpath] = (fileSize, uploadTime, contentHash)
+            c.close()
+        except Error as e:
+            logger.error(e)
+
+        return fingerprints
+
+    def db_update_fingerprints(self, figInfoList):
+        """
+        update the file status of the indexed figures.
+
+        Parameters
+        ----------
+        figInfoList: list
+        figures returned by `parse_traj_file` with the content_hash.
+        """
+
+        try:
+            c = self.conn.cursor()
+            for figInfo in figInfoList:
+                c.execute(
+                    self.db_config['sql_query']['update_traj_fingerprint'],
+                    (
+                        figInfo['upload_time'].strftime('%Y-%m-%d %H:%M:%S'),
+                        figInfo['file_size'],
+                        figInfo['content_hash'],
+                        figInfo.get('width'),
+                        figInfo.get('height'),
+                        os.path.join(figInfo['path'], figInfo['filename'])
+                    )
+                )
+            self.conn.commit()
+            c.close()
+        except Error as e:
+            logger.error(e)
+            return False
+
+        return True
+
+    def db_query_registered_hashes(self):
+        """
+        query the content fingerprints of the figures, which have been
+        written to the done_filelist.
+
+        Returns
+        -------
+        registeredHashes: dict
+        {imgpath: registered_hash}
+        """
+
+        registeredHashes = {}
+
+        try:
+            c = self.conn.cursor()
+            c.execute(self.db_config['sql_query']['select_registered_hashes'])
+            registeredHashes = dict(c.fetchall())
+            c.close()
+        except Error as e:
+            logger.error(e)
+
+        return registeredHashes
+
+    def db_update_registered_hashes(self, figInfoList):
+        """
+        record the content fingerprints of the figures, which have been
+        written to the done_filelist.
+
+        Parameters
+        ----------
+        figInfoList: list
+        figures returned by `parse_traj_file` with the content_hash.
+        """
+
+        try:
+            c = self.conn.cursor()
+            c.executemany(
+                self.db_config['sql_query']['update_registered_hash'],
+                [(figInfo['content_hash'],
+                  os.path.join(figInfo['path'], figInfo['filename']))
+                 for figInfo in figInfoList])
+            self.conn.commit()
+            c.close()
+        except Error as e:
+            logger.error(e)
+            return False
+
+        return True
+
+    def filter_changed_figs(self, figInfoList):
+        """
+        sort out the figures which were rewritten with identical content.
+        The fingerprint is only calculated for the new figures and the
+        figures whose size or modification time was changed.
+
+        Parameters
+        ----------
+        figInfoList: list
+        figures returned by `parse_traj_file`.
+
+        Returns
+        -------
+        newFigList: list
+        figures which are not in the database.
+
+        changedFigList: list
+        indexed figures with modified content.
+
+        rewrittenFigList: list
+        indexed figures with identical content, but modified size or
+        modification time.
+        """
+
+        fingerprints = self.db_query_fingerprints()
+
+        newFigList = []
+        changedFigList = []
+        rewrittenFigList = []
+        for figInfo in figInfoList:
+            imgpath = os.path.join(figInfo['path'], figInfo['filename'])
+            cached = fingerprints.get(imgpath)
+
+            if cached is None:
+                figInfo['content_hash'] = file_fingerprint(imgpath)
+                newFigList.append(figInfo)
+                continue
+
+            cachedSize, cachedUploadTime, cachedHash = cached
+            unmodified = (cachedSize == figInfo['file_size']) and \
+                (cachedUploadTime ==
+                 figInfo['upload_time'].strftime('%Y-%m-%d %H:%M:%S'))
+
+            if unmodified and (cachedHash is not None):
+                figInfo['content_hash'] = cachedHash
+                continue
+
+            figInfo['content_hash'] = file_fingerprint(imgpath)
+            if unmodified or (figInfo['content_hash'] == cachedHash):
+                rewrittenFigList.append(figInfo)
+            else:
+                changedFigList.append(figInfo)
+
+        logger.info('{new} new and {changed} changed figures, {rewritten} '
+                    'figures rewritten with identical content.'.format(
+                        new=len(newFigList),
+                        changed=len(changedFigList),
+                        rewritten=len(rewrittenFigList)))
+
+        self.read_fig_headers(newFigList + changedFigList)
+
+        return newFigList, changedFigList, rewrittenFigList
+
+    def read_fig_headers(self, figInfoList):
+        """
+        read the image size of the new or changed figures.
+
+        Parameters
+        ----------
+        figInfoList: list
+        figures returned by `parse_traj_file`. width and height will be
+        added to each figure.
+        """
+
+        for figInfo in figInfoList:
+            imgpath = os.path.join(figInfo['path'], figInfo['filename'])
+            try:
+                figInfo['width'], figInfo['height'] = read_png_size(imgpath)
+            except OSError as e:
+                logger.warning(e)
+                figInfo['width'], figInfo['height'] = None, None
+
+            if figInfo['width'] is None:
+                logger.debug('invalid PNG header: {}'.format(imgpath))
+
+    def db_close(self,):
+        """
+        close the database.
+        """
+        self.conn.close()
+
+    def scan_traj_files(self, start_time,
+                        elapse_time=datetime.timedelta(days=30)):
+        """
+        scan the trajectory figures.
+
+        Parameters
+        ----------
+        start_time: datetime obj
+        start time of the searching.
+
+        Keywords
+        --------
+        elapse_time: timedelta obj
+        the searching limit away from the start time.
+
+        Returns
+        -------
+        figInfoList: dict
+            filename: str
+            path: str
+            station: str
+
+        History
+        -------
+        2019-10-01. First edition by Zhenping
+        """
+        fileList = []
+        stationList = self.station_index.stations_on_disk
+
+        dateList = [start_time - datetime.timedelta(days=iDay)
+                    for iDay in range(
+                        0,
+                        int(elapse_time / datetime.timedelta(days=1) + 1)
+                                     )]
+        for thisDate in dateList:
+            for station in stationList:
+                fileList.extend(self.scan_traj_dir(station, thisDate))
+
+        return fileList
+
+    def scan_traj_dir(self, station, thisDate):
+        """
+        scan the trajectory figures of a single station-day folder.
+
+        Parameters
+        ----------
+        station: str
+        GDAS1 station name.
+
+        thisDate: datetime obj
+        date of the folder.
+
+        Returns
+        -------
+        fileList: list
+        the same as the elements returned by `scan_traj_files`.
+        """
+
+        fileList = []
+        trjPath = os.path.join(
+            config['TRAJECTORY_ROOT'],
+            station,
+            thisDate.strftime('%Y'),
+            thisDate.strftime('%m'),
+            thisDate.strftime('%d')
+        )
+
+        figs = glob.glob(os.path.join(trjPath, '*.png'))
+        for fig in figs:
+            figInfo = {
+                'filename': os.path.basename(fig),
+                'path': os.path.dirname(fig),
+                'station': station
+            }
+
+            fileList.append(figInfo.copy())
+
+        return fileList
+
+    def db_query_indexed_imgpaths(self, folder):
+        """
+        query the indexed figures under a folder. The query is answered by
+        the unique index of imgpath.
+
+        Parameters
+        ----------
+        folder: str
+        absolute path of the folder, e.g. a station-month folder.
+
+        Returns
+        -------
+        imgpaths: set
+        """
+
+        # all the paths with the prefix of 'folder/'
+        prefix = os.path.join(folder, '')
+
+        try:
+            c = self.conn.cursor()
+            c.execute(
+                self.db_config['sql_query']['select_imgpaths_range'],
+                (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+            imgpaths = set(row[0] for row in c.fetchall())
+            c.close()
+        except Error as e:
+            logger.error(e)
+            return set()
+
+        return imgpaths
 
-            start_time: datetime obj
-            start time of the results.
+    def db_query_indexed_slots(self, start_time, stop_time):
+        """
+        query the product slots which have been indexed in the database.
 
-            stop_time: datetime obj
-            stop time of the results.
+        Parameters
+        ----------
+        start_time: datetime obj
+        first day of the query.
 
-            upload_time: datetime obj
-            uploading time of the results.
+        stop_time: datetime obj
+        last day of the query.
 
-        History
+        Returns
         -------
-        2019-10-01. First edition by Zhenping.
+        indexedSlots: dict
+        {(gdas1_station, date): set of (category, hour)}
         """
 
-        if type(entry) is dict:
-            entry = [entry]
+        indexedSlots = {}
 
-        for item in entry:
-            single_entry_tuple = (
-                item['imgpath'],
-                item['category'],
-                item['pollynet_station'],
-                item['gdas1_station'],
-                item['ending_height'],
-                item['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                item['stop_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                item['upload_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            c = self.conn.cursor()
+            c.execute(
+                self.db_config['sql_query']['select_indexed_figs'],
+                (
+                    start_time.strftime('%Y-%m-%d 00:00:00'),
+                    stop_time.strftime('%Y-%m-%d 23:59:59')
+                )
             )
+            rows = c.fetchall()
+            c.close()
+        except Error as e:
+            logger.error(e)
+            return indexedSlots
 
-            try:
-                c = self.conn.cursor()
-                c.execute(self.db_config['sql_query']
-                          ['insert_traj_entry'], single_entry_tuple)
-                self.conn.commit()
-                c.close()
+        for imgpath, gdas1Station, figStartTime in rows:
+            slot = traj_fig_slot(os.path.basename(imgpath))
+            if slot is None:
+                continue
 
-            except Error as e:
-                logger.error(e)
-                logger.info(single_entry_tuple[0])
+            key = (gdas1Station, figStartTime[0:10])
+            indexedSlots.setdefault(key, set()).add(slot)
 
-        return True
+        return indexedSlots
 
-    def db_drop_table(self):
+    def db_query_gap_rescans(self, start_time, stop_time):
         """
-        delete the table.
+        query the previous rescans of the station-days.
+
+        Parameters
+        ----------
+        start_time: datetime obj
+        first day of the query.
+
+        stop_time: datetime obj
+        last day of the query.
+
+        Returns
+        -------
+        gapRescans: dict
+        {(gdas1_station, 'YYYY-mm-dd'): (last_rescan, n_missing)}
+        n_missing is the number of missing products before the rescan.
         """
 
-        if self.conn is None:
-            logger.warn('database does not exist.')
-            return False
+        gapRescans = {}
 
         try:
             c = self.conn.cursor()
             c.execute(
-                self.db_config['sql_query']['drop_traj_table']
+                self.db_config['sql_query']['select_gap_rescans'],
+                (
+                    start_time.strftime('%Y-%m-%d'),
+                    stop_time.strftime('%Y-%m-%d')
+                )
             )
-            self.conn.commit()
-
-            logger.info('Delete the table successfully.')
+            for station, date, lastRescan, nMissing in c.fetchall():
+                gapRescans[(station, date)] = (lastRescan, nMissing)
+            c.close()
         except Error as e:
             logger.error(e)
-            return False
 
-        return True
+        return gapRescans
 
-    def db_delete_entry(self, entry_dict):
+    def db_record_gap_rescans(self, gapList):
         """
-        delete entry.
+        record the rescan time of the station-days.
 
         Parameters
         ----------
-        entry_dict: dict
-            filename: str
-            filename of the trajectory results.
-
-            pollynet_station: str
-            pollynet station name.
-
-        History
-        -------
-        2019-10-01. First edition by Zhenping
+        gapList: list
+        rescanned gaps returned by `find_traj_gaps`.
         """
 
+        rescanTime = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
         try:
             c = self.conn.cursor()
-            c.execute(
-                        self.db_config['sql_query']['delete_entry'],
-                        (
-                            entry_dict['imgpath'],
-                            entry_dict['pollynet_station']
-                        )
-                    )
+            c.executemany(
+                self.db_config['sql_query']['upsert_gap_rescan'],
+                [(gap['station'], gap['date'].strftime('%Y-%m-%d'),
+                  rescanTime, len(gap['missing'])) for gap in gapList])
             self.conn.commit()
-            logger.info(
-                'Delete the entries with the searching arguments {}'.
-                format(str(entry_dict))
-                )
-
             c.close()
         except Error as e:
             logger.error(e)
@@ -226,16 +1168,10 @@ class TrajScanner(object):
 
         return True
 
-    def db_close(self,):
-        """
-        close the database.
-        """
-        self.conn.close()
-
-    def scan_traj_files(self, start_time,
-                        elapse_time=datetime.timedelta(days=30)):
+    def find_traj_gaps(self, start_time,
+                       elapse_time=datetime.timedelta(days=30)):
         """
-        scan the trajectory figures.
+        compare the expected trajectory products against the indexed ones.
 
         Parameters
         ----------
@@ -249,42 +1185,103 @@ class TrajScanner(object):
 
         Returns
         -------
-        figInfoList: dict
-            filename: str
-            path: str
+        gapList: list
+        prioritized station-days with missing products. Each element has the
+        variables below:
             station: str
-
-        History
-        -------
-        2019-10-01. First edition by Zhenping
+            date: datetime obj
+            missing: list of (category, hour)
+            partial: bool
+            whether part of the products of the day has been indexed.
+
+            last_rescan: str or None
+            time of the previous rescan, if it didn't find any of the
+            missing products.
+        Partially indexed days come first, as these are the days most likely
+        to be fixed by a rescan, followed by the number of missing products
+        and the date (latest first). The days whose previous rescan found
+        nothing are put at the end, the least recently rescanned first, so
+        that they don't block the other gaps. The hourly products of the
+        current day are only expected up to the current hour, and the daily
+        products of the current day are not expected yet.
         """
-        fileList = []
-        stationList = list(self.station_name_table.keys())
+
+        stationList = self.station_index.stations_on_disk
+        expectedSlots = self.config_manager.expected_slots
+        todaySlots = set(
+            slot for slot in expectedSlots
+            if (slot[1] is not None) and (slot[1] <= start_time.hour))
 
         dateList = [start_time - datetime.timedelta(days=iDay)
                     for iDay in range(
                         0,
                         int(elapse_time / datetime.timedelta(days=1) + 1)
                                      )]
+        indexedSlots = self.db_query_indexed_slots(dateList[-1], dateList[0])
+        gapRescans = self.db_query_gap_rescans(dateList[-1], dateList[0])
+
+        gapList = []
         for thisDate in dateList:
+            if thisDate.date() == start_time.date():
+                dateSlots = todaySlots
+            else:
+                dateSlots = expectedSlots
+
             for station in stationList:
-                trjPath = os.path.join(
-                    config['TRAJECTORY_ROOT'],
-                    station,
-                    thisDate.strftime('%Y'),
-                    thisDate.strftime('%m'),
-                    thisDate.strftime('%d')
-                )
+                dateKey = (station, thisDate.strftime('%Y-%m-%d'))
+                foundSlots = indexedSlots.get(dateKey, set())
+                missingSlots = dateSlots - foundSlots
+                if not missingSlots:
+                    continue
+
+                # the previous rescan didn't find any missing product
+                lastRescan, nMissing = gapRescans.get(dateKey, (None, None))
+                if nMissing != len(missingSlots):
+                    lastRescan = None
+
+                gapList.append({
+                    'station': station,
+                    'date': thisDate,
+                    'missing': sorted(
+                        missingSlots,
+                        key=lambda slot: (slot[0], -1 if slot[1] is None
+                                          else slot[1])),
+                    'partial': len(foundSlots) > 0,
+                    'last_rescan': lastRescan
+                })
+
+        gapList.sort(key=lambda gap: (
+            gap['last_rescan'] is not None,
+            gap['last_rescan'] or '',
+            not gap['partial'],
+            -len(gap['missing']),
+            -gap['date'].toordinal()
+        ))
+
+        return gapList
+
+    def scan_traj_gaps(self, gapList):
+        """
+        rescan the station-day folders of the gaps.
+
+        Parameters
+        ----------
+        gapList: list
+        gaps returned by `find_traj_gaps`.
 
-                figs = glob.glob(os.path.join(trjPath, '*.png'))
-                for fig in figs:
-                    figInfo = {
-                        'filename': os.path.basename(fig),
-                        'path': os.path.dirname(fig),
-                        'station': station
-                    }
+        Returns
+        -------
+        fileList: list
+        figures which fill in the missing products, the same as the elements
+        returned by `scan_traj_files`.
+        """
 
-                    fileList.append(figInfo.copy())
+        fileList = []
+        for gap in gapList:
+            missingSlots = set(gap['missing'])
+            for figInfo in self.scan_traj_dir(gap['station'], gap['date']):
+                if traj_fig_slot(figInfo['filename']) in missingSlots:
+                    fileList.append(figInfo)
 
         return fileList
 
@@ -313,7 +1310,7 @@ class TrajScanner(object):
 
         for figInfo in figInfoList:
             pollynetStationNameList = \
-                (self.station_name_table[figInfo['station']]['name_PollyNET'])
+                self.station_index.gdas1_to_pollynet[figInfo['station']]
             for pollynetStation in pollynetStationNameList:
                 entry['imgpath'] = os.path.join(
                     figInfo['path'],
@@ -326,6 +1323,10 @@ class TrajScanner(object):
                 entry['start_time'] = figInfo['start_time']
                 entry['stop_time'] = figInfo['stop_time']
                 entry['upload_time'] = figInfo['upload_time']
+                entry['file_size'] = figInfo['file_size']
+                entry['content_hash'] = figInfo.get('content_hash')
+                entry['width'] = figInfo.get('width')
+                entry['height'] = figInfo.get('height')
 
                 entryList.append(entry.copy())
 
@@ -367,231 +1368,219 @@ class TrajScanner(object):
             seconds=dtObj.second
             )
 
-        traj_prof_pat = re.compile(
-            "(?P<date>\d{8})_(?P<hour>\d{2})_(?P<height>\d{5})" +
-            "_trajectories_prof.png")
-        traj_map_pat = re.compile(
-            "(?P<date>\d{8})_(?P<hour>\d{2})_(?P<height>\d{5})" +
-            "_trajectories_map.png")
-        traj_geonames_20_pat = re.compile(
-            "(?P<date>\d{8})_.*-geonames-abs-region-ens-below2.0km.png")
-        traj_geonames_50_pat = re.compile(
-            "(?P<date>\d{8})_.*-geonames-abs-region-ens-below5.0km.png")
-        traj_geonames_80_pat = re.compile(
-            "(?P<date>\d{8})_.*-geonames-abs-region-ens-below8.0km.png")
-        traj_geonames_md_pat = re.compile(
-            "(?P<date>\d{8})_.*-geonames-abs-region-ens-belowmd.png")
-        traj_region_land_20_pat = re.compile(
-            "(?P<date>\d{8})_.*-land-use-abs-occ-ens-below2.0km.png")
-        traj_region_land_50_pat = re.compile(
-            "(?P<date>\d{8})_.*-land-use-abs-occ-ens-below5.0km.png")
-        traj_region_land_80_pat = re.compile(
-            "(?P<date>\d{8})_.*-land-use-abs-occ-ens-below8.0km.png")
-        traj_region_land_md_pat = re.compile(
-            "(?P<date>\d{8})_.*-land-use-abs-occ-ens-belowmd.png")
-
         for item in fileList:
-            if traj_prof_pat.match(item['filename']):
-                res = re.search(traj_prof_pat, item['filename'])
-
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = res.group('height')
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + tdObj
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 10
-
-            elif traj_map_pat.match(item['filename']):
-                res = re.search(traj_map_pat, item['filename'])
-
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
+            for category, pattern in TRAJ_FIG_PATTERNS:
+                res = pattern.match(item['filename'])
+                if res:
+                    break
+            else:
+                logger.debug('unknown trajectory figure: {}'.format(
+                    os.path.join(item['path'], item['filename'])))
+                continue
+
+            # construct the returned dict
+            figInfo['filename'] = item['filename']
+            figInfo['path'] = item['path']
+            figInfo['station'] = item['station']
+            figInfo['start_time'] = datetime.datetime.strptime(
+                res.group('date'), '%Y%m%d')
+            if category in TRAJ_HOURLY_CATEGORIES:
                 figInfo['ending_height'] = res.group('height')
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
                 figInfo['stop_time'] = figInfo['start_time'] + tdObj
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 9
-
-            elif traj_region_land_20_pat.match(item['filename']):
-                res = re.search(traj_region_land_20_pat, item['filename'])
-
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 5
-
-            elif traj_region_land_50_pat.match(item['filename']):
-                res = re.search(traj_region_land_50_pat, item['filename'])
-
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 6
-
-            elif traj_region_land_80_pat.match(item['filename']):
-                res = re.search(traj_region_land_80_pat, item['filename'])
-
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
+            else:
                 figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
                 figInfo['stop_time'] = figInfo['start_time'] + \
                     datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 7
-
-            elif traj_region_land_md_pat.match(item['filename']):
-                res = re.search(traj_region_land_md_pat, item['filename'])
+            figStat = os.stat(os.path.join(item['path'], item['filename']))
+            figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
+                figStat.st_mtime)
+            figInfo['file_size'] = figStat.st_size
+            # The category table can be found in readme.md
+            figInfo['category'] = category
 
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 8
+            figInfoList.append(figInfo.copy())
 
-            elif traj_geonames_20_pat.match(item['filename']):
-                res = re.search(traj_geonames_20_pat, item['filename'])
+        return figInfoList
 
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 1
+    def parse_traj_file_bulk(self, fileList, readHeader=False, indexed=None):
+        """
+        parse a batch of trajectory results filenames at once. The times and
+        heights are computed as arrays for the whole batch instead of
+        datetime objects for each single file.
 
-            elif traj_geonames_50_pat.match(item['filename']):
-                res = re.search(traj_geonames_50_pat, item['filename'])
+        Parameters
+        ----------
+        fileList: list
+        the same as `parse_traj_file`.
 
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 2
+        Keywords
+        --------
+        readHeader: bool
+        whether to read the image size from the PNG headers. The content
+        fingerprint is calculated as well if `CONTENT_HASH` is enabled.
 
-            elif traj_geonames_80_pat.match(item['filename']):
-                res = re.search(traj_geonames_80_pat, item['filename'])
+        indexed: set
+        imgpaths in the database. These figures are skipped before reading
+        the files, as they would be ignored by `db_insert_rows` anyway. The
+        modified ones are updated by the regular scans.
 
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 3
+        Returns
+        -------
+        figBatch: dict
+        columns of the parsed figures.
+            imgpath: numpy.ndarray
+            station: numpy.ndarray
+            category: numpy.ndarray
+            ending_height: numpy.ndarray
+            start_time: numpy.ndarray (datetime64[s])
+            stop_time: numpy.ndarray (datetime64[s])
+            upload_time: numpy.ndarray (datetime64[s])
+            file_size: numpy.ndarray
+            content_hash: list
+            width: list
+            height: list
+        """
 
-            elif traj_geonames_md_pat.match(item['filename']):
-                res = re.search(traj_geonames_md_pat, item['filename'])
+        # convert timedelta string to seconds
+        dtObj = datetime.datetime.strptime(
+            config['INTERVAL_TRAJ_FIG'],
+            '%H:%M:%S'
+            )
+        intervalSeconds = dtObj.hour * 3600 + dtObj.minute * 60 + dtObj.second
+
+        imgpathList = []
+        stationList = []
+        categoryList = []
+        dateList = []
+        heightList = []
+        mtimeList = []
+        sizeList = []
+        hashList = []
+        widthList = []
+        heightPxList = []
+        contentHash = readHeader and config.get('CONTENT_HASH', False)
+        for item in fileList:
+            for category, pattern in TRAJ_FIG_PATTERNS:
+                res = pattern.match(item['filename'])
+                if res:
+                    break
+            else:
+                logger.debug('unknown trajectory figure: {}'.format(
+                    os.path.join(item['path'], item['filename'])))
+                continue
+
+            imgpath = os.path.join(item['path'], item['filename'])
+            if (indexed is not None) and (imgpath in indexed):
+                continue
+            figStat = os.stat(imgpath)
+
+            imgpathList.append(imgpath)
+            stationList.append(item['station'])
+            categoryList.append(category)
+            dateList.append(res.group('date'))
+            heightList.append(res.group('height')
+                              if category in TRAJ_HOURLY_CATEGORIES else 0)
+            mtimeList.append(figStat.st_mtime)
+            sizeList.append(figStat.st_size)
+
+            hashList.append(file_fingerprint(imgpath) if contentHash else None)
+            if readHeader:
+                width, height = read_png_size(imgpath)
+                widthList.append(width)
+                heightPxList.append(height)
+            else:
+                widthList.append(None)
+                heightPxList.append(None)
+
+        category = np.array(categoryList, dtype=np.int64)
+        hourly = np.isin(category, TRAJ_HOURLY_CATEGORIES)
+
+        # convert each unique date only once
+        uniqueDates, inverse = np.unique(
+            np.array(dateList, dtype='U8'), return_inverse=True)
+        startTime = np.array(
+            ['{}-{}-{}'.format(date[0:4], date[4:6], date[6:8])
+             for date in uniqueDates],
+            dtype='datetime64[s]')[inverse]
+        stopTime = startTime + np.where(
+            hourly, intervalSeconds, 23 * 3600 + 59 * 60 + 59
+            ).astype('timedelta64[s]')
+        uploadTime = np.floor(np.array(mtimeList, dtype=np.float64)).\
+            astype(np.int64).astype('datetime64[s]')
+
+        return {
+            'imgpath': np.array(imgpathList, dtype=object),
+            'station': np.array(stationList, dtype=object),
+            'category': category,
+            'ending_height': np.array(heightList, dtype=np.int64),
+            'start_time': startTime,
+            'stop_time': stopTime,
+            'upload_time': uploadTime,
+            'file_size': np.array(sizeList, dtype=np.int64),
+            'content_hash': hashList,
+            'width': widthList,
+            'height': heightPxList
+        }
+
+    def setup_insert_rows_bulk(self, figBatch):
+        """
+        expand the figures to each PollyNET station and format the rows for
+        `db_insert_rows`.
 
-                # construct the returned dict
-                figInfo['filename'] = item['filename']
-                figInfo['path'] = item['path']
-                figInfo['station'] = item['station']
-                figInfo['ending_height'] = 0
-                figInfo['start_time'] = datetime.datetime.strptime(
-                    res.group('date'), '%Y%m%d')
-                figInfo['stop_time'] = figInfo['start_time'] + \
-                    datetime.timedelta(hours=23, minutes=59, seconds=59)
-                figInfo['upload_time'] = datetime.datetime.utcfromtimestamp(
-                    os.path.getmtime(
-                        os.path.join(item['path'], item['filename'])
-                    )
-                )
-                # The category table can be found in readme.md
-                figInfo['category'] = 4
+        Parameters
+        ----------
+        figBatch: dict
+        returned by `parse_traj_file_bulk`.
 
-            figInfoList.append(figInfo.copy())
+        Returns
+        -------
+        rows: list
+        values of the `insert_traj_entry` query.
+        """
 
-        return figInfoList
+        if len(figBatch['imgpath']) == 0:
+            return []
+
+        # alias lists of each unique GDAS1 station
+        uniqueStations, inverse = np.unique(
+            figBatch['station'].astype(str), return_inverse=True)
+        aliasLists = [self.station_index.gdas1_to_pollynet[station]
+                      for station in uniqueStations]
+        aliasCounts = np.array([len(aliases) for aliases in aliasLists])
+        aliasOffsets = np.cumsum(aliasCounts) - aliasCounts
+        aliases = np.array(
+            [alias for aliasList in aliasLists for alias in aliasList],
+            dtype=object)
+
+        # one row for each figure and alias
+        nAlias = aliasCounts[inverse]
+        figIndex = np.repeat(np.arange(len(nAlias)), nAlias)
+        aliasIndex = np.arange(len(figIndex)) - \
+            np.repeat(np.cumsum(nAlias) - nAlias, nAlias) + \
+            aliasOffsets[inverse][figIndex]
+
+        insertTime = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        nRows = len(figIndex)
+        contentHash = np.array(
+            figBatch['content_hash'], dtype=object)[figIndex]
+        width = np.array(figBatch['width'], dtype=object)[figIndex]
+        height = np.array(figBatch['height'], dtype=object)[figIndex]
+
+        return list(zip(
+            figBatch['imgpath'][figIndex].tolist(),
+            figBatch['category'][figIndex].tolist(),
+            aliases[aliasIndex].tolist(),
+            figBatch['station'][figIndex].tolist(),
+            figBatch['ending_height'][figIndex].tolist(),
+            datetime64_to_str(figBatch['start_time'])[figIndex].tolist(),
+            datetime64_to_str(figBatch['stop_time'])[figIndex].tolist(),
+            datetime64_to_str(figBatch['upload_time'])[figIndex].tolist(),
+            [insertTime] * nRows,
+            figBatch['file_size'][figIndex].tolist(),
+            contentHash.tolist(),
+            width.tolist(),
+            height.tolist()
+        ))
 
 
 def convert_to_pollyDB_entry(entryList):
@@ -722,8 +1711,8 @@ def convert_to_pollyDB_entry(entryList):
                         (ld.location_fk = loc.id) AND
                         (ld.lidar_fk = l.id);""", (
                         entry['pollynet_station'],
-                        entry['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                        entry['stop_time'].strftime('%Y-%m-%d %H:%M:%S')
+                        format_time(entry['start_time']),
+                        format_time(entry['stop_time'])
                     )
                   )
 
@@ -753,9 +1742,9 @@ def convert_to_pollyDB_entry(entryList):
                 'software_version': item[9],
                 'product_type': product_type,
                 'product_starttime':
-                    entry['start_time'].strftime('%Y%m%d %H:%M:%S'),
+                    format_time(entry['start_time'], '%Y%m%d %H:%M:%S'),
                 'product_stoptime':
-                    entry['stop_time'].strftime('%Y%m%d %H:%M:%S')
+                    format_time(entry['stop_time'], '%Y%m%d %H:%M:%S')
             }
 
             pollyDB_entryList.append(pollyDB_entry)
@@ -781,18 +1770,21 @@ def setup_done_filelist(file, pollyDB_entryList):
 
     with open(file, 'a', encoding='utf-8') as fh:
         for entry in pollyDB_entryList:
-            logger.info('write {image}, {loc}, {polly} to the done_filelist'.
-                        format(
-                            image=entry['image'],
-                            loc=entry['location'],
-                            polly=entry['lidar']
-                            )
-                        )
+            logger.debug('write {image}, {loc}, {polly} to the done_filelist'.
+                         format(
+                             image=entry['image'],
+                             loc=entry['location'],
+                             polly=entry['lidar']
+                             )
+                         )
             for key, value in entry.items():
                 fh.write('{key}={value}\n'.format(key=key, value=value))
 
             fh.write('------\n')
 
+    logger.info('write {n:,} entries to {file}'.format(
+        n=len(pollyDB_entryList), file=file))
+
 
 def scan_traj_into_sqliteDB():
     """
@@ -814,13 +1806,115 @@ def scan_traj_into_sqliteDB():
 
     fileInfoList = scanner.parse_traj_file(fileList)
 
+    if config.get('CONTENT_HASH', False):
+        # only the new figures will be inserted
+        fileInfoList, changedList, rewrittenList = \
+            scanner.filter_changed_figs(fileInfoList)
+        scanner.db_update_fingerprints(changedList + rewrittenList)
+    else:
+        # skip the figures indexed with the same size and modification time
+        fingerprints = scanner.db_query_fingerprints()
+        newList = []
+        changedList = []
+        for figInfo in fileInfoList:
+            cached = fingerprints.get(
+                os.path.join(figInfo['path'], figInfo['filename']))
+            if cached is None:
+                newList.append(figInfo)
+            elif (cached[0] != figInfo['file_size']) or \
+                    (cached[1] !=
+                     figInfo['upload_time'].strftime('%Y-%m-%d %H:%M:%S')):
+                figInfo['content_hash'] = None
+                changedList.append(figInfo)
+        scanner.read_fig_headers(newList + changedList)
+        scanner.db_update_fingerprints(changedList)
+        fileInfoList = newList
+
+    entryList = scanner.setup_insert_entries(fileInfoList)
+
+    scanner.db_insert_entry(entryList)
+
+    scanner.db_close()
+
+
+def rescan_traj_gaps():
+    """
+    rescan the station-day folders with missing trajectory plots into the
+    sqlite3 Database.
+    """
+
+    logger.info('Start to rescan the missing backward trajectory results...')
+
+    scanner = TrajScanner()
+
+    scanner.db_connect()
+
+    scanner.db_create_table()
+
+    gapList = scanner.find_traj_gaps(
+        datetime.datetime.now(),
+        elapse_time=datetime.timedelta(days=config['GAP_SCAN_DAYS']))
+    logger.info('{nGap} station-days with missing products, rescan {nDir}.'.
+                format(nGap=len(gapList),
+                       nDir=min(len(gapList), config['MAX_GAP_RESCAN'])))
+    for gap in gapList[0:config['MAX_GAP_RESCAN']]:
+        logger.debug('{station} {date}: {nMissing} missing products'.format(
+            station=gap['station'],
+            date=gap['date'].strftime('%Y-%m-%d'),
+            nMissing=len(gap['missing'])))
+
+    fileList = scanner.scan_traj_gaps(gapList[0:config['MAX_GAP_RESCAN']])
+
+    fileInfoList = scanner.parse_traj_file(fileList)
+
+    scanner.read_fig_headers(fileInfoList)
+
     entryList = scanner.setup_insert_entries(fileInfoList)
 
     scanner.db_insert_entry(entryList)
 
+    scanner.db_record_gap_rescans(gapList[0:config['MAX_GAP_RESCAN']])
+
     scanner.db_close()
 
 
+def watch_traj_into_sqliteDB():
+    """
+    keep adding the new trajectory plots into the sqlite3 Database. The
+    configurations are reloaded without restarting when they were modified.
+    """
+
+    logger.info('Start to watch the backward trajectory results...')
+
+    scanner = TrajScanner()
+
+    while True:
+        scanner.reload_config()
+
+        scanner.db_connect()
+
+        scanner.db_create_table()
+
+        # only the station-days with missing products will be scanned
+        gapList = scanner.find_traj_gaps(
+            datetime.datetime.now(),
+            elapse_time=datetime.timedelta(days=config['WATCH_SCAN_DAYS']))
+
+        fileList = scanner.scan_traj_gaps(gapList)
+
+        fileInfoList = scanner.parse_traj_file(fileList)
+
+        scanner.read_fig_headers(fileInfoList)
+
+        entryList = scanner.setup_insert_entries(fileInfoList)
+
+        scanner.db_insert_entry(entryList)
+
+        scanner.db_close()
+
+        time.sleep(config['WATCH_INTERVAL'])
+
+
 def make_done_filelist_4_traj():
     """
     create the done_filelist for the trajectory plots.
@@ -833,19 +1927,118 @@ def make_done_filelist_4_traj():
     filelist = scanner.scan_traj_files(datetime.datetime.now(),
                                        elapse_time=datetime.timedelta(days=1000))
     fileInfoList = scanner.parse_traj_file(filelist)
+
+    if config.get('CONTENT_HASH', False):
+        # skip the figures which have been registered with identical content.
+        # The figures indexed by the other scanners are not registered yet.
+        scanner.db_connect()
+        scanner.db_create_table()
+        newList, changedList, rewrittenList = \
+            scanner.filter_changed_figs(fileInfoList)
+        registeredHashes = scanner.db_query_registered_hashes()
+        fileInfoList = [
+            figInfo for figInfo in fileInfoList
+            if registeredHashes.get(
+                os.path.join(figInfo['path'], figInfo['filename'])) !=
+            figInfo['content_hash']]
+        logger.info('{} figures to be registered with PollyNET.'.format(
+            len(fileInfoList)))
+
     entryList = scanner.setup_insert_entries(fileInfoList)
 
     doneEntryList = convert_to_pollyDB_entry(entryList)
     setup_done_filelist(config['DONE_FILELIST'], doneEntryList)
 
+    if config.get('CONTENT_HASH', False):
+        # record the figures after the done_filelist was written
+        scanner.db_insert_entry(scanner.setup_insert_entries(newList))
+        scanner.db_update_fingerprints(changedList + rewrittenList)
+        # only the figures with an entry in the done_filelist are registered.
+        # The others are retried, e.g. when the lidar data arrives later.
+        doneImgpaths = set(
+            os.path.join(os.path.dirname(config['TRAJECTORY_ROOT']),
+                         entry['image'])
+            for entry in doneEntryList)
+        scanner.db_update_registered_hashes([
+            figInfo for figInfo in fileInfoList
+            if os.path.join(figInfo['path'], figInfo['filename'])
+            in doneImgpaths])
+        scanner.db_close()
+
+
+def profile_run(func, nTop=20):
+    """
+    run the function with the profiler and save the profile to the log
+    folder.
+
+    Parameters
+    ----------
+    func: function
+    entry point of the scanner, e.g. `make_done_filelist_4_traj`.
+
+    Keywords
+    --------
+    nTop: int
+    number of hot functions to be logged.
+
+    Returns
+    -------
+    profileFile: str
+    absolute path of the pstats file, which can be loaded with `pstats` or
+    converted to other formats, e.g. by snakeviz or flameprof.
+    """
+
+    profileFile = os.path.join(
+        PROJECTDIR, 'log',
+        '{time}_{func}_profile.pstats'.format(
+            time=datetime.datetime.now().strftime('%Y%m%d_%H%M%S'),
+            func=func.__name__)
+    )
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        func()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profileFile)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).\
+            sort_stats('tottime').print_stats(nTop)
+        logger.info('Hot functions of {}:\n{}'.format(
+            func.__name__, stream.getvalue()))
+
+    logger.info('Save the profile to {}'.format(profileFile))
+
+    return profileFile
+
 
 def main():
 
+    parser = argparse.ArgumentParser(
+        description='Trajectory files scanner for Picasso.')
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='profile the run and save the profile to the log folder.')
+    args = parser.parse_args()
+
+    if args.profile:
+        run = profile_run
+    else:
+        def run(func):
+            return func()
+
     # scan the trajectory plots to a local SQLite3 Database
-    # scan_traj_into_sqliteDB()
+    # run(scan_traj_into_sqliteDB)
+
+    # rescan the station-days with missing trajectory plots
+    # run(rescan_traj_gaps)
+
+    # keep scanning the new trajectory plots to a local SQLite3 Database
+    # run(watch_traj_into_sqliteDB)
 
     # scan the trajectory plots and save it to done_filelist.txt
-    make_done_filelist_4_traj()
+    run(make_done_filelist_4_traj)
 
 
 if __name__ == "__main__":